@@ -21,6 +21,9 @@ app.config['PROCESSED_FOLDER'] = os.path.join(os.getcwd(), 'processed')
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500 MB max upload
 app.config['ALLOWED_EXTENSIONS'] = {'pdf'}
 app.config['OLLAMA_MODEL'] = os.environ.get('OLLAMA_MODEL', 'granite3.2-vision:latest')
+# Hand downloads off to the front-end web server (nginx/Apache) when one is
+# configured to honour X-Sendfile / X-Accel-Redirect headers
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
 
 # Ensure upload and processed directories exist
 upload_dir = Path(app.config['UPLOAD_FOLDER'])
@@ -29,6 +32,12 @@ processed_dir = Path(app.config['PROCESSED_FOLDER'])
 upload_dir.mkdir(exist_ok=True, parents=True)
 processed_dir.mkdir(exist_ok=True, parents=True)
 
+# Spool multipart uploads straight to disk instead of buffering in memory
+from app.utils.uploads import DiskBufferedRequest
+
+DiskBufferedRequest.upload_tmp_dir = app.config['UPLOAD_FOLDER']
+app.request_class = DiskBufferedRequest
+
 # Import routes
 from app import routes
 
@@ -3,7 +3,9 @@ Routes for the Flask application
 """
 
 import os
+import time
 import logging
+import requests
 from pathlib import Path
 from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory
 from werkzeug.utils import secure_filename
@@ -11,12 +13,35 @@ from werkzeug.utils import secure_filename
 from app import app
 from app.utils.pdf_processor_ollama import process_pdf, batch_process_pdfs
 from app.utils.openwebui_exporter import prepare_for_openwebui, OpenWebUIExporter
+from app.utils.uploads import (
+    save_upload,
+    file_sha256,
+    lookup_processed,
+    record_processed,
+    processing_cache_key,
+)
+from app.utils.task_queue import (
+    get_task_queue,
+    fetch_job,
+    process_pdf_job,
+    batch_process_pdfs_job,
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Suffix tuple precomputed from ALLOWED_EXTENSIONS so the per-file upload
+# check is a single C-level endswith call; rebuilt if the config is replaced
+_allowed_suffixes = None
+_allowed_source = None
+
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+    global _allowed_suffixes, _allowed_source
+    extensions = app.config['ALLOWED_EXTENSIONS']
+    if extensions is not _allowed_source:
+        _allowed_suffixes = tuple('.' + ext.lower() for ext in extensions)
+        _allowed_source = extensions
+    return filename.lower().endswith(_allowed_suffixes)
 
 @app.route('/')
 def index():
@@ -37,13 +62,39 @@ def upload_file():
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        save_upload(file, filepath)
 
         try:
             # Get processing options
             use_vision = request.form.get('use_vision', 'false').lower() == 'true'
             max_workers = int(request.form.get('max_workers', 4))
 
+            # Skip the whole pipeline when an identical PDF was already
+            # processed with the same options
+            digest = file_sha256(filepath)
+            cache_key = processing_cache_key(digest, app.config['OLLAMA_MODEL'], use_vision)
+            cached_files = lookup_processed(app.config['PROCESSED_FOLDER'], cache_key)
+            if cached_files is not None:
+                flash(f'File {filename} already processed! Output files: {", ".join([os.path.basename(f) for f in cached_files])}')
+                return redirect(url_for('index'))
+
+            # Hand the conversion to a background worker when a queue is
+            # configured, so the request thread is not blocked for minutes
+            task_queue = get_task_queue()
+            if task_queue is not None:
+                job = task_queue.enqueue(
+                    process_pdf_job,
+                    Path(filepath),
+                    Path(app.config['PROCESSED_FOLDER']),
+                    cache_key=cache_key,
+                    model_name=app.config['OLLAMA_MODEL'],
+                    use_vision=use_vision,
+                    max_workers=max_workers,
+                    job_timeout='1h'
+                )
+                flash(f'File {filename} queued for processing (job {job.id})')
+                return redirect(url_for('index'))
+
             # Process the PDF with Ollama
             output_files = process_pdf(
                 Path(filepath),
@@ -52,6 +103,7 @@ def upload_file():
                 use_vision=use_vision,
                 max_workers=max_workers
             )
+            record_processed(app.config['PROCESSED_FOLDER'], cache_key, Path(filepath).stem)
 
             flash(f'File {filename} processed successfully! Output files: {", ".join([os.path.basename(f) for f in output_files])}')
         except Exception as e:
@@ -78,13 +130,36 @@ def batch_upload():
 
     results = []
     file_paths = []
+    cache_keys = {}
+    cached_outputs = {}
+
+    # Resolve the config folders once; Path arithmetic per file is cheaper
+    # than rebuilding the strings with os.path.join for every upload
+    upload_dir = Path(app.config['UPLOAD_FOLDER'])
+    processed_folder = app.config['PROCESSED_FOLDER']
+    model_name = app.config['OLLAMA_MODEL']
 
     for file in files:
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            file_paths.append(Path(filepath))
+            dst = upload_dir / filename
+            save_upload(file, dst)
+
+            # Reuse previous results for PDFs with identical contents,
+            # processed with the same options
+            digest = file_sha256(dst)
+            cache_key = processing_cache_key(digest, model_name, use_vision)
+            cached_files = lookup_processed(processed_folder, cache_key)
+            if cached_files is not None:
+                cached_outputs[filename] = cached_files
+                results.append({
+                    'name': filename,
+                    'status': 'cached'
+                })
+                continue
+
+            cache_keys[filename] = cache_key
+            file_paths.append(dst)
             results.append({
                 'name': filename,
                 'status': 'uploaded'
@@ -96,7 +171,34 @@ def batch_upload():
                 'error': 'Invalid file type'
             })
 
+    if not file_paths:
+        return jsonify({
+            'message': f'All {len(cached_outputs)} files already processed',
+            'results': results,
+            'output_files': cached_outputs
+        })
+
     try:
+        # Hand the batch to a background worker when a queue is configured
+        task_queue = get_task_queue()
+        if task_queue is not None:
+            job = task_queue.enqueue(
+                batch_process_pdfs_job,
+                file_paths,
+                Path(app.config['PROCESSED_FOLDER']),
+                cache_keys=cache_keys,
+                model_name=app.config['OLLAMA_MODEL'],
+                use_vision=use_vision,
+                max_workers=max_workers,
+                job_timeout='2h'
+            )
+            return jsonify({
+                'message': f'Queued {len(file_paths)} files for processing',
+                'job_id': job.id,
+                'status_url': url_for('job_status', job_id=job.id),
+                'results': results
+            }), 202
+
         # Process all PDFs as a batch
         output_files = batch_process_pdfs(
             file_paths,
@@ -106,6 +208,11 @@ def batch_upload():
             max_workers=max_workers
         )
 
+        for name, cache_key in cache_keys.items():
+            if output_files.get(name):
+                record_processed(app.config['PROCESSED_FOLDER'], cache_key, Path(name).stem)
+        output_files.update(cached_outputs)
+
         return jsonify({
             'message': f'Processed {len(file_paths)} files successfully',
             'results': results,
@@ -118,21 +225,87 @@ def batch_upload():
             'results': results
         }), 500
 
+@app.route('/status/<job_id>')
+def job_status(job_id):
+    """
+    Check the status of a queued processing job
+    """
+    job = fetch_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    payload = {'job_id': job_id, 'status': job.get_status()}
+    if job.is_finished:
+        payload['result'] = job.result
+    elif job.is_failed:
+        payload['error'] = 'Job failed'
+
+    return jsonify(payload)
+
+# File extensions surfaced by /files (text-type outputs usable for RAG)
+LISTED_EXTENSIONS = {'.txt', '.json', '.md'}
+
+def _iter_processed_files(dirpath, rel=''):
+    """
+    Yield paths of RAG-usable files under dirpath, relative to it
+
+    Uses os.scandir so file-type checks come from the directory entries
+    instead of an extra stat call per file.
+    """
+    try:
+        entries = os.scandir(dirpath)
+    except OSError:
+        # Directory vanished between listing and recursion (e.g. a document
+        # was deleted mid-scan); treat it as empty like os.walk would
+        return
+    with entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                # Internal bookkeeping such as the content-cache index
+                # (.hash_index.json) lives here but is not a document
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_processed_files(entry.path, rel + entry.name + '/')
+            elif entry.is_file() and os.path.splitext(entry.name)[1] in LISTED_EXTENSIONS:
+                yield rel + entry.name
+
+# Cached /files listing, invalidated when any directory under the processed
+# folder changes (creating or deleting a file bumps its parent's mtime)
+_LIST_CACHE = {'dir_mtimes': None, 'files': None}
+
+def _scan_dir_mtimes(dirpath, mtimes):
+    """
+    Record mtime_ns for dirpath and every subdirectory below it
+    """
+    try:
+        mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+        entries = os.scandir(dirpath)
+    except OSError:
+        # Directory vanished mid-scan; skip it like os.walk would
+        return mtimes
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                _scan_dir_mtimes(entry.path, mtimes)
+    return mtimes
+
 @app.route('/files')
 def list_files():
-    processed_files = []
-    for root, dirs, files in os.walk(app.config['PROCESSED_FOLDER']):
-        for file in files:
-            # Only include text and json files for RAG
-            if file.endswith('.txt') or file.endswith('.json') or file.endswith('.md'):
-                rel_path = os.path.relpath(os.path.join(root, file), app.config['PROCESSED_FOLDER'])
-                processed_files.append(rel_path)
-
-    return jsonify({'files': processed_files})
+    # Re-walk the files only when a directory mtime changed; polling UIs
+    # otherwise pay O(number of directories) stats instead of a full listing
+    root = app.config['PROCESSED_FOLDER']
+    dir_mtimes = _scan_dir_mtimes(root, {})
+    if dir_mtimes != _LIST_CACHE['dir_mtimes']:
+        _LIST_CACHE['files'] = list(_iter_processed_files(root))
+        _LIST_CACHE['dir_mtimes'] = dir_mtimes
+    return jsonify({'files': _LIST_CACHE['files']})
 
 @app.route('/download/<path:filename>')
 def download_file(filename):
-    return send_from_directory(app.config['PROCESSED_FOLDER'], filename, as_attachment=True)
+    # conditional=True enables range requests and lets the WSGI server swap in
+    # its wsgi.file_wrapper (sendfile) when serving the bytes itself
+    return send_from_directory(app.config['PROCESSED_FOLDER'], filename,
+                               as_attachment=True, conditional=True)
 
 @app.route('/openwebui-export')
 def openwebui_export():
@@ -193,7 +366,8 @@ def download_export(filename):
     """
     Download an export package
     """
-    return send_from_directory(app.config['PROCESSED_FOLDER'], filename, as_attachment=True)
+    return send_from_directory(app.config['PROCESSED_FOLDER'], filename,
+                               as_attachment=True, conditional=True)
 
 @app.route('/instructions/<export_id>')
 def view_instructions(export_id):
@@ -203,19 +377,38 @@ def view_instructions(export_id):
     # This can be expanded to show specific instructions for an export
     return render_template('openwebui_export.html')
 
+# Cached Ollama model list; the installed models change rarely, so a short
+# TTL spares the HTTP round-trip for dashboards that poll this endpoint
+_MODELS_CACHE = {'ts': 0.0, 'models': None}
+_MODELS_CACHE_TTL = 30  # seconds
+
+# Shared session so cache refreshes reuse the TCP connection to Ollama
+_ollama_session = requests.Session()
+
+def _get_ollama_models():
+    """
+    Return the list of available Ollama model names, cached for a short TTL
+    """
+    now = time.monotonic()
+    if _MODELS_CACHE['models'] is not None and now - _MODELS_CACHE['ts'] < _MODELS_CACHE_TTL:
+        return _MODELS_CACHE['models']
+
+    response = _ollama_session.get("http://localhost:11434/api/tags")
+    response.raise_for_status()
+    models = [model['name'] for model in response.json().get('models', [])]
+
+    _MODELS_CACHE['ts'] = now
+    _MODELS_CACHE['models'] = models
+    return models
+
 @app.route('/ollama-models')
 def ollama_models():
     """
     Get a list of available Ollama models
     """
     try:
-        import requests
-        response = requests.get("http://localhost:11434/api/tags")
-        if response.status_code == 200:
-            models = [model['name'] for model in response.json().get('models', [])]
-            return jsonify({'models': models, 'current': app.config['OLLAMA_MODEL']})
-        else:
-            return jsonify({'error': 'Failed to get models from Ollama API'}), 500
+        models = _get_ollama_models()
+        return jsonify({'models': models, 'current': app.config['OLLAMA_MODEL']})
     except Exception as e:
         logger.error(f"Error getting Ollama models: {str(e)}")
         return jsonify({'error': str(e)}), 500
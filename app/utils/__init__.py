@@ -4,10 +4,16 @@ Utility modules for the PDF processing application.
 
 from app.utils.pdf_processor_ollama import process_pdf, batch_process_pdfs
 from app.utils.openwebui_exporter import prepare_for_openwebui, OpenWebUIExporter
+from app.utils.uploads import DiskBufferedRequest, save_upload
+from app.utils.task_queue import get_task_queue, fetch_job
 
 __all__ = [
     'process_pdf',
     'batch_process_pdfs',
     'prepare_for_openwebui',
-    'OpenWebUIExporter'
+    'OpenWebUIExporter',
+    'DiskBufferedRequest',
+    'save_upload',
+    'get_task_queue',
+    'fetch_job'
 ]
@@ -0,0 +1,134 @@
+"""
+Shared helpers for talking to the local Ollama API.
+"""
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Model lists change rarely, so /api/tags responses are cached per API URL;
+# processors are built per request, and without this every conversion pays a
+# fresh round-trip for the same information
+MODELS_CACHE_TTL = 60  # seconds
+
+_models_cache = {}
+_models_lock = threading.Lock()
+
+def get_available_models(api_url, ttl=MODELS_CACHE_TTL):
+    """
+    Return the model names known to the Ollama server at api_url
+
+    The parsed list is cached for ttl seconds and shared across processor
+    instances.
+
+    Args:
+        api_url: Base URL of the Ollama API (e.g. http://localhost:11434/api)
+        ttl: Cache lifetime in seconds
+
+    Returns:
+        List of model names; empty when the server cannot be reached
+    """
+    now = time.monotonic()
+    with _models_lock:
+        cached = _models_cache.get(api_url)
+        if cached is not None and now - cached[0] < ttl:
+            return cached[1]
+
+    try:
+        response = requests.get(f"{api_url}/tags")
+        if response.status_code == 200:
+            models = [model['name'] for model in response.json().get('models', [])]
+        else:
+            logger.error("Failed to get models from Ollama API")
+            return []
+    except Exception as e:
+        logger.error(f"Error connecting to Ollama: {e}")
+        return []
+
+    with _models_lock:
+        _models_cache[api_url] = (now, models)
+
+    return models
+
+
+# On-disk cache for LLM responses. Inference dominates wall time, and the
+# same input (a recurring cover page, a re-uploaded document) produces the
+# same analysis, so responses are reused across runs and across documents.
+_LLM_CACHE_ROOT = Path.home() / '.cache' / 'docling-pdf-processor'
+
+def llm_cache_key(*parts):
+    """
+    Build a cache key from the pieces that determine an LLM response
+
+    Args:
+        parts: Byte strings or text strings (image bytes, model name, prompt)
+
+    Returns:
+        Hex digest usable as a cache file name
+    """
+    digest = hashlib.blake2b()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(part)
+    return digest.hexdigest()
+
+def llm_cache_get(kind, key):
+    """
+    Look up a cached LLM response
+
+    Args:
+        kind: Cache namespace (e.g. 'vision', 'markdown')
+        key: Key from llm_cache_key
+
+    Returns:
+        The cached response text, or None on a miss
+    """
+    path = _LLM_CACHE_ROOT / kind / f"{key}.txt"
+    try:
+        return path.read_text(encoding='utf-8')
+    except OSError:
+        return None
+
+def llm_cache_put(kind, key, text):
+    """
+    Store an LLM response in the on-disk cache
+
+    Cache failures are logged and swallowed; the cache is an optimization,
+    not a dependency.
+
+    Args:
+        kind: Cache namespace (e.g. 'vision', 'markdown')
+        key: Key from llm_cache_key
+        text: Response text to store
+    """
+    path = _LLM_CACHE_ROOT / kind / f"{key}.txt"
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding='utf-8')
+    except OSError as e:
+        logger.warning(f"Could not write LLM cache entry: {e}")
+
+def resolve_model_name(model_name, api_url):
+    """
+    Verify that a model is available, falling back to the first installed one
+
+    Args:
+        model_name: Requested Ollama model name
+        api_url: Base URL of the Ollama API
+
+    Returns:
+        The requested model name, or the first available model when the
+        requested one is not installed
+    """
+    models = get_available_models(api_url)
+    if models and model_name not in models:
+        logger.warning(f"Model {model_name} not found in Ollama. Available models: {models}")
+        model_name = models[0]  # Use the first available model
+        logger.info(f"Using model {model_name} instead")
+    return model_name
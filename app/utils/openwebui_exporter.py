@@ -1,18 +1,95 @@
 """
 Export processed files for use with Open WebUI RAG
 """
-import os
+import io
 import json
+import mmap
+import shutil
 import zipfile
-import tempfile
 import logging
-import shutil
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Any
 
 logger = logging.getLogger(__name__)
 
+# Prefer orjson's C encoder for the manifest; fall back to the stdlib when it
+# is not installed. Output is compact unless pretty is requested.
+try:
+    import orjson
+
+    def _dump_json(obj, pretty=False):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+except ImportError:
+    def _dump_json(obj, pretty=False):
+        if pretty:
+            return json.dumps(obj, indent=2).encode('utf-8')
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+# Use a SIMD-accelerated deflate for the archive when one is installed.
+# zlib-ng is a drop-in zlib replacement; isal is faster still but only
+# supports compression levels 0-3.
+_ZIP_COMPRESSLEVEL = 6
+try:
+    from zlib_ng import zlib_ng as _fast_zlib
+    zipfile.zlib = _fast_zlib
+    zipfile.crc32 = _fast_zlib.crc32
+except ImportError:
+    try:
+        from isal import isal_zlib as _fast_zlib
+        zipfile.zlib = _fast_zlib
+        zipfile.crc32 = _fast_zlib.crc32
+        _ZIP_COMPRESSLEVEL = 3  # isal's maximum level
+    except ImportError:
+        pass
+
+# Suffixes of formats that are already compressed and gain nothing from deflate
+_STORED_SUFFIXES = {'.zip', '.gz', '.png', '.jpg', '.jpeg'}
+
+# Copy buffer for streaming file bytes into the archive; 1 MiB keeps the
+# read/write loop far away from the 16 KiB default chunking
+_COPY_BUFFER_SIZE = 1 << 20
+
+# Exports whose input files total less than this are assembled in memory and
+# written to disk with a single write; larger ones stream to the output file
+_IN_MEMORY_LIMIT = 32 << 20
+
+# Files at least this large are memory-mapped into the deflate stream so the
+# kernel pages their bytes in on demand; below this the mmap setup overhead
+# outweighs the saved copies
+_MMAP_THRESHOLD = 8 << 20
+
+
+def _add_file_to_zip(zipf: zipfile.ZipFile, file_path: Path, arcname: str, size: int = None):
+    """
+    Add a file to the archive, storing already-compressed formats as-is and
+    memory-mapping large ones into the deflate stream
+
+    Args:
+        zipf: Open zip archive
+        file_path: Source file on disk
+        arcname: Name for the file inside the archive
+        size: File size in bytes, if the caller already statted the file
+    """
+    if size is None:
+        size = file_path.stat().st_size
+
+    if file_path.suffix.lower() in _STORED_SUFFIXES:
+        info = zipfile.ZipInfo.from_file(file_path, arcname=arcname)
+        info.compress_type = zipfile.ZIP_STORED
+        with open(file_path, 'rb') as src, zipf.open(info, 'w') as dst:
+            shutil.copyfileobj(src, dst, length=_COPY_BUFFER_SIZE)
+    elif size >= _MMAP_THRESHOLD:
+        info = zipfile.ZipInfo.from_file(file_path, arcname=arcname)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with open(file_path, 'rb') as src, \
+                mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                zipf.open(info, 'w', force_zip64=True) as dst:
+            dst.write(memoryview(mm))
+    else:
+        zipf.write(file_path, arcname=arcname)
+
+
 class OpenWebUIExporter:
     """
     Export processed files for use with Open WebUI RAG system
@@ -33,65 +110,76 @@ class OpenWebUIExporter:
         if not export_id:
             export_id = f"openwebui_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
 
-        # Create a temporary directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
+        # Create manifest
+        manifest = {
+            "id": export_id,
+            "created": datetime.now().isoformat(),
+            "files": []
+        }
+
+        # README for import instructions
+        instructions = """# Open WebUI Import Instructions
 
-            # Create manifest
-            manifest = {
-                "id": export_id,
-                "created": datetime.now().isoformat(),
-                "files": []
-            }
+1. Go to your Open WebUI installation
+2. Navigate to Collections
+3. Click "Create Collection" or select an existing collection
+4. Click "Import" and select this zip file
+5. Configure chunking settings as needed
+6. Start using your documents in RAG conversations!
+"""
 
-            # Copy files to temp directory and add to manifest
+        # Stat every file once up front; the results drive the existence
+        # check, the size heuristic and the manifest entries
+        file_stats = {}
+        for file_path in files:
+            try:
+                file_stats[file_path] = file_path.stat()
+            except OSError:
+                logger.warning(f"File not found: {file_path}")
+
+        def _write_archive(zipf):
+            # Zip the files straight from their source paths rather than
+            # copying them into a staging directory first
             for file_path in files:
-                if not file_path.exists():
-                    logger.warning(f"File not found: {file_path}")
+                st = file_stats.get(file_path)
+                if st is None:
                     continue
 
                 # Get relative name (remove parent directory)
                 rel_name = file_path.name
-
-                # Copy the file
-                dst_path = temp_path / rel_name
-                shutil.copy2(file_path, dst_path)
+                _add_file_to_zip(zipf, file_path, rel_name, size=st.st_size)
 
                 # Add to manifest
                 manifest["files"].append({
                     "name": rel_name,
                     "path": rel_name,
-                    "size": os.path.getsize(file_path),
+                    "size": st.st_size,
                     "type": file_path.suffix[1:] if file_path.suffix else "txt"
                 })
 
-            # Write manifest
-            with open(temp_path / "manifest.json", 'w') as f:
-                json.dump(manifest, f, indent=2)
-
-            # Create README for import instructions
-            instructions = """# Open WebUI Import Instructions
-
-1. Go to your Open WebUI installation
-2. Navigate to Collections
-3. Click "Create Collection" or select an existing collection
-4. Click "Import" and select this zip file
-5. Configure chunking settings as needed
-6. Start using your documents in RAG conversations!
-"""
-            with open(temp_path / "README.md", 'w') as f:
-                f.write(instructions)
-
-            # Create the zip file
-            output_dir = Path.cwd() / "processed"
-            output_dir.mkdir(exist_ok=True)
-
-            output_path = output_dir / f"{export_id}.zip"
-            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_path in temp_path.glob('*'):
-                    zipf.write(file_path, arcname=file_path.name)
-
-            return output_path
+            zipf.writestr("manifest.json", _dump_json(manifest))
+            zipf.writestr("README.md", instructions)
+
+        # Create the zip file
+        output_dir = Path.cwd() / "processed"
+        output_dir.mkdir(exist_ok=True)
+        output_path = output_dir / f"{export_id}.zip"
+
+        total_size = sum(st.st_size for st in file_stats.values())
+        if total_size <= _IN_MEMORY_LIMIT:
+            # Small export: build the archive in memory and write it out in
+            # a single pass instead of dribbling zip members to disk
+            buf = io.BytesIO()
+            with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED,
+                                 compresslevel=_ZIP_COMPRESSLEVEL) as zipf:
+                _write_archive(zipf)
+            output_path.write_bytes(buf.getbuffer())
+        else:
+            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED,
+                                 compresslevel=_ZIP_COMPRESSLEVEL) as zipf:
+                _write_archive(zipf)
+
+        return output_path
 
 def prepare_for_openwebui(processed_dir: Path, doc_names: List[str], formats: List[str]) -> Dict[str, Any]:
     """
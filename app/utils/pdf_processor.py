@@ -1,9 +1,13 @@
+import gc
 import logging
+import re
 import time
 from pathlib import Path
 from typing import List, Dict, Any
 import os
 import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 from docling.datamodel.base_models import ConversionStatus, InputFormat
 from docling.datamodel.document import ConversionResult
@@ -14,17 +18,68 @@ from docling_core.types.doc import ImageRefMode
 
 logger = logging.getLogger(__name__)
 
+# Force a garbage collection every this many documents during a batch so
+# page-image buffers from dropped ConversionResults are actually reclaimed
+_GC_DOC_INTERVAL = 8
+
+# Markdown syntax stripped when deriving the plain-text output from the
+# markdown rendering (image placeholders, headings, emphasis, table rules)
+_MD_IMAGE_RE = re.compile(r'!\[[^\]]*\]\([^)]*\)|<!-- image -->')
+_MD_HEADING_RE = re.compile(r'^#{1,6}\s+', re.MULTILINE)
+_MD_EMPHASIS_RE = re.compile(r'(\*{1,3}|_{1,3})(\S(?:.*?\S)?)\1')
+_MD_TABLE_RULE_RE = re.compile(r'^\|?(?:\s*:?-+:?\s*\|?)+\s*$', re.MULTILINE)
+
+
+def _markdown_to_text(md_content: str) -> str:
+    """
+    Derive a plain-text rendering from already-generated markdown
+
+    Args:
+        md_content: Markdown produced for the same document
+
+    Returns:
+        The markdown with structural syntax stripped
+    """
+    text = _MD_IMAGE_RE.sub('', md_content)
+    text = _MD_HEADING_RE.sub('', text)
+    text = _MD_EMPHASIS_RE.sub(r'\2', text)
+    text = _MD_TABLE_RULE_RE.sub('', text)
+    return text
+
+
+def _write_batch_metadata(output_dir: Path, metadata_batch: List[Dict]) -> None:
+    """
+    Flush a batch's collected metadata in one write instead of opening and
+    closing a tiny per-document metadata file
+
+    The file is appended to, not rewritten: batch mode skips the per-document
+    _metadata.json files, so this jsonl is the only metadata record and must
+    accumulate across batches into the same output directory.
+
+    Args:
+        output_dir: Directory where the processed files are saved
+        metadata_batch: Metadata dicts collected during the batch
+    """
+    if not metadata_batch:
+        return
+    batch_metadata_path = output_dir / "batch_metadata.jsonl"
+    with open(batch_metadata_path, 'a', encoding='utf-8') as f:
+        f.writelines(json.dumps(m) + '\n' for m in metadata_batch)
+
+
 class DoclingProcessor:
     """
     A class that handles PDF processing using Docling
     """
 
-    def __init__(self, debug_mode=False):
+    def __init__(self, debug_mode=False, generate_images=False):
         """
         Initialize the Docling processor
 
         Args:
             debug_mode: Whether to enable debug visualizations
+            generate_images: Whether to rasterize page images; only needed
+                for the HTML preview output, so it defaults to off
         """
         # Configure debug visualizations if needed
         if debug_mode:
@@ -33,9 +88,13 @@ class DoclingProcessor:
             settings.debug.visualize_tables = True
             settings.debug.visualize_cells = True
 
-        # Configure pipeline options
+        self.generate_images = generate_images
+
+        # Configure pipeline options. Rasterizing every page is a large
+        # compute and memory cost, and the JSON/markdown/text outputs drop
+        # the images anyway, so only enable it when HTML is wanted.
         self.pipeline_options = PdfPipelineOptions()
-        self.pipeline_options.generate_page_images = True
+        self.pipeline_options.generate_page_images = generate_images
 
         # Create document converter
         self.doc_converter = DocumentConverter(
@@ -44,13 +103,17 @@ class DoclingProcessor:
             }
         )
 
-    def process_single_pdf(self, pdf_path: Path, output_dir: Path) -> List[str]:
+    def process_single_pdf(self, pdf_path: Path, output_dir: Path,
+                           metadata_sink: List[Dict] = None) -> List[str]:
         """
         Process a single PDF using Docling
 
         Args:
             pdf_path: Path to the PDF file
             output_dir: Directory where the processed files will be saved
+            metadata_sink: Optional list collecting metadata dicts; when given,
+                the per-document metadata file is skipped (see
+                _save_conversion_result)
 
         Returns:
             List of output file paths
@@ -65,7 +128,9 @@ class DoclingProcessor:
         # Convert the PDF
         try:
             conv_result = self.doc_converter.convert(pdf_path, raises_on_error=True)
-            output_files = self._save_conversion_result(conv_result, output_dir)
+            output_files = self._save_conversion_result(
+                conv_result, output_dir, metadata_sink=metadata_sink
+            )
 
             end_time = time.time() - start_time
             logger.info(f"Document conversion complete in {end_time:.2f} seconds.")
@@ -97,16 +162,27 @@ class DoclingProcessor:
 
         # Convert the PDFs
         try:
+            # Consume convert_all as a stream: save each result as soon as it
+            # arrives and drop the reference immediately, so peak memory holds
+            # roughly one document's conversion state instead of the batch's
+            results = {}
+            metadata_batch = []
             conv_results = self.doc_converter.convert_all(
                 pdf_paths,
-                raises_on_error=True,
+                raises_on_error=False,
             )
-
-            results = {}
-            for conv_result in conv_results:
+            for doc_count, conv_result in enumerate(conv_results, 1):
                 input_filename = conv_result.input.file.name
-                output_files = self._save_conversion_result(conv_result, output_dir)
-                results[input_filename] = output_files
+                try:
+                    results[input_filename] = self._save_conversion_result(
+                        conv_result, output_dir, metadata_sink=metadata_batch
+                    )
+                finally:
+                    del conv_result
+                if doc_count % _GC_DOC_INTERVAL == 0:
+                    gc.collect()
+
+            _write_batch_metadata(output_dir, metadata_batch)
 
             end_time = time.time() - start_time
             logger.info(f"Batch conversion complete in {end_time:.2f} seconds.")
@@ -116,13 +192,17 @@ class DoclingProcessor:
             logger.error(f"Error in batch conversion: {e}", exc_info=True)
             raise
 
-    def _save_conversion_result(self, conv_result: ConversionResult, output_dir: Path) -> List[str]:
+    def _save_conversion_result(self, conv_result: ConversionResult, output_dir: Path,
+                                metadata_sink: List[Dict] = None) -> List[str]:
         """
         Save conversion results to various formats
 
         Args:
             conv_result: Conversion result from Docling
             output_dir: Directory where the processed files will be saved
+            metadata_sink: Optional list collecting metadata dicts; when given,
+                the per-document metadata file is skipped so the caller can
+                flush the whole batch in one write
 
         Returns:
             List of output file paths
@@ -144,29 +224,31 @@ class DoclingProcessor:
             )
             output_files.append(str(json_path))
 
-            # Save as HTML (for preview)
-            html_path = doc_output_dir / f"{doc_filename}.html"
-            conv_result.document.save_as_html(
-                html_path,
-                image_mode=ImageRefMode.EMBEDDED,
-            )
-            output_files.append(str(html_path))
+            # Save as HTML (for preview); requires page images, so only
+            # produced when the processor was built with generate_images
+            if self.generate_images:
+                html_path = doc_output_dir / f"{doc_filename}.html"
+                conv_result.document.save_as_html(
+                    html_path,
+                    image_mode=ImageRefMode.EMBEDDED,
+                )
+                output_files.append(str(html_path))
+
+            # Render the markdown once; the plain-text variant is derived
+            # from the same string rather than re-serializing the whole
+            # document tree a second time
 
             # Save as Markdown (good for text-based RAG)
-            md_path = doc_output_dir / f"{doc_filename}.md"
-            conv_result.document.save_as_markdown(
-                md_path,
+            md_content = conv_result.document.export_to_markdown(
                 image_mode=ImageRefMode.PLACEHOLDER,
             )
+            md_path = doc_output_dir / f"{doc_filename}.md"
+            md_path.write_text(md_content, encoding='utf-8')
             output_files.append(str(md_path))
 
             # Save as plain text (best for simple RAG)
             txt_path = doc_output_dir / f"{doc_filename}.txt"
-            conv_result.document.save_as_markdown(
-                txt_path,
-                image_mode=ImageRefMode.PLACEHOLDER,
-                strict_text=True,
-            )
+            txt_path.write_text(_markdown_to_text(md_content), encoding='utf-8')
             output_files.append(str(txt_path))
 
             # Export metadata about the document for RAG context
@@ -177,11 +259,14 @@ class DoclingProcessor:
                 "output_files": [os.path.basename(f) for f in output_files]
             }
 
-            metadata_path = doc_output_dir / f"{doc_filename}_metadata.json"
-            with open(metadata_path, 'w') as f:
-                json.dump(metadata, f, indent=2)
-
-            output_files.append(str(metadata_path))
+            if metadata_sink is not None:
+                # Batch mode: defer the write so the whole batch's metadata
+                # lands in a single file at the end
+                metadata_sink.append(metadata)
+            else:
+                metadata_path = doc_output_dir / f"{doc_filename}_metadata.json"
+                metadata_path.write_text(json.dumps(metadata, indent=2))
+                output_files.append(str(metadata_path))
 
             return output_files
         elif conv_result.status == ConversionStatus.PARTIAL_SUCCESS:
@@ -195,8 +280,21 @@ class DoclingProcessor:
             return []
 
 
+@lru_cache(maxsize=4)
+def get_processor(debug_mode: bool = False, generate_images: bool = False) -> DoclingProcessor:
+    """
+    Return a process-wide DoclingProcessor for the given options
+
+    Constructing a DoclingProcessor rebuilds the DocumentConverter and (on
+    first use) loads the layout/OCR models, which can take several seconds.
+    Caching one instance per option combination removes that cold-start from
+    every call after the first; call this at application startup to warm it up.
+    """
+    return DoclingProcessor(debug_mode=debug_mode, generate_images=generate_images)
+
+
 # Simplified interface functions
-def process_pdf(pdf_path: Path, output_dir: Path, debug_mode=False) -> List[str]:
+def process_pdf(pdf_path: Path, output_dir: Path, debug_mode=False, generate_images=False) -> List[str]:
     """
     Process a single PDF using Docling
 
@@ -204,25 +302,92 @@ def process_pdf(pdf_path: Path, output_dir: Path, debug_mode=False) -> List[str]
         pdf_path: Path to the PDF file
         output_dir: Directory where the processed files will be saved
         debug_mode: Whether to enable debug visualizations
+        generate_images: Whether to rasterize pages and emit the HTML preview
 
     Returns:
         List of output file paths
     """
-    processor = DoclingProcessor(debug_mode=debug_mode)
+    processor = get_processor(debug_mode=debug_mode, generate_images=generate_images)
     return processor.process_single_pdf(pdf_path, output_dir)
 
 
-def batch_process_pdfs(pdf_paths: List[Path], output_dir: Path, debug_mode=False) -> Dict[str, List[str]]:
+# Worker-side processor, created once per worker process by _init_worker so
+# the Docling models are loaded a single time per worker rather than per PDF
+_worker_processor = None
+
+
+def _init_worker(debug_mode: bool, generate_images: bool):
+    global _worker_processor
+    _worker_processor = get_processor(debug_mode=debug_mode, generate_images=generate_images)
+
+
+def _process_one(args):
+    """
+    Convert a single PDF inside a worker process
+
+    The document's metadata dict is returned to the parent instead of being
+    written here, so the batch produces one batch_metadata.jsonl regardless
+    of how the work was distributed.
+
+    Args:
+        args: Tuple of (pdf_path, output_dir)
+
+    Returns:
+        Tuple of (input file name, list of output file paths, metadata dict
+        or None on failure)
+    """
+    pdf_path, output_dir = args
+    metadata_sink = []
+    try:
+        output_files = _worker_processor.process_single_pdf(
+            pdf_path, output_dir, metadata_sink=metadata_sink
+        )
+        return pdf_path.name, output_files, metadata_sink[0] if metadata_sink else None
+    except Exception as e:
+        logger.error(f"Error processing {pdf_path.name}: {e}")
+        return pdf_path.name, [], None
+
+
+def batch_process_pdfs(pdf_paths: List[Path], output_dir: Path, debug_mode=False,
+                       generate_images=False, max_workers=None) -> Dict[str, List[str]]:
     """
     Process multiple PDFs as a batch
 
+    The PDFs are fanned out across a pool of worker processes, each holding a
+    warm DoclingProcessor, so the compute-bound conversion pipeline scales
+    with the available CPU cores instead of running sequentially.
+
     Args:
         pdf_paths: List of paths to PDF files
         output_dir: Directory where the processed files will be saved
         debug_mode: Whether to enable debug visualizations
+        generate_images: Whether to rasterize pages and emit the HTML preview
+        max_workers: Number of worker processes (defaults to the CPU count)
 
     Returns:
         Dictionary mapping input file names to lists of output file paths
     """
-    processor = DoclingProcessor(debug_mode=debug_mode)
-    return processor.process_batch(pdf_paths, output_dir)
+    if len(pdf_paths) <= 1:
+        # Not worth spinning up a pool for a single document
+        processor = get_processor(debug_mode=debug_mode, generate_images=generate_images)
+        return processor.process_batch(pdf_paths, output_dir)
+
+    logger.info(f"Processing batch of {len(pdf_paths)} PDFs across worker processes")
+
+    results = {}
+    metadata_batch = []
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(debug_mode, generate_images)
+    ) as executor:
+        for name, output_files, metadata in executor.map(
+            _process_one, ((p, output_dir) for p in pdf_paths)
+        ):
+            results[name] = output_files
+            if metadata is not None:
+                metadata_batch.append(metadata)
+
+    _write_batch_metadata(output_dir, metadata_batch)
+
+    return results
@@ -0,0 +1,120 @@
+"""
+Optional Redis-backed task queue for running PDF processing off the
+request thread.
+"""
+import os
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+try:
+    from redis import Redis
+    from rq import Queue
+    from rq.job import Job
+except ImportError:
+    Redis = None
+    Queue = None
+    Job = None
+
+_queue = None
+_queue_checked = False
+
+def get_task_queue():
+    """
+    Return the shared RQ queue, or None when background processing is
+    unavailable.
+
+    The queue is created on first use when the REDIS_URL environment
+    variable is set and the redis/rq packages are installed; otherwise
+    processing stays synchronous on the request thread. Workers are
+    started separately with `rq worker pdf-processing`.
+    """
+    global _queue, _queue_checked
+    if _queue_checked:
+        return _queue
+    _queue_checked = True
+
+    redis_url = os.environ.get('REDIS_URL')
+    if not redis_url:
+        return None
+
+    if Queue is None:
+        logger.warning("REDIS_URL is set but the redis/rq packages are not installed")
+        return None
+
+    try:
+        connection = Redis.from_url(redis_url)
+        connection.ping()
+        _queue = Queue('pdf-processing', connection=connection)
+        logger.info("Background processing enabled via RQ queue 'pdf-processing'")
+    except Exception as e:
+        logger.error(f"Error connecting to Redis at {redis_url}: {e}")
+
+    return _queue
+
+def process_pdf_job(pdf_path, output_dir, cache_key=None, **options):
+    """
+    Queue entry point: convert one PDF and record it in the content cache
+
+    Runs inside the RQ worker. Mirrors the synchronous route, which records
+    the digest after a successful conversion; without this the cache never
+    populates when a queue is configured.
+
+    Args:
+        pdf_path: Path to the PDF file
+        output_dir: Directory where the processed files will be saved
+        cache_key: Content-cache key for the upload, or None to skip caching
+        options: Keyword arguments forwarded to process_pdf
+
+    Returns:
+        List of output file paths
+    """
+    from app.utils.pdf_processor_ollama import process_pdf
+    from app.utils.uploads import record_processed
+
+    output_files = process_pdf(pdf_path, output_dir, **options)
+    if cache_key is not None and output_files:
+        record_processed(output_dir, cache_key, Path(pdf_path).stem)
+    return output_files
+
+def batch_process_pdfs_job(pdf_paths, output_dir, cache_keys=None, **options):
+    """
+    Queue entry point: convert a batch and record each document in the cache
+
+    Args:
+        pdf_paths: List of paths to PDF files
+        output_dir: Directory where the processed files will be saved
+        cache_keys: Mapping of input file name to content-cache key
+        options: Keyword arguments forwarded to batch_process_pdfs
+
+    Returns:
+        Dictionary mapping input file names to lists of output file paths
+    """
+    from app.utils.pdf_processor_ollama import batch_process_pdfs
+    from app.utils.uploads import record_processed
+
+    results = batch_process_pdfs(pdf_paths, output_dir, **options)
+    for name, key in (cache_keys or {}).items():
+        if results.get(name):
+            record_processed(output_dir, key, Path(name).stem)
+    return results
+
+def fetch_job(job_id: str):
+    """
+    Look up a queued job by its ID
+
+    Args:
+        job_id: ID returned when the job was enqueued
+
+    Returns:
+        The RQ job, or None if the queue is unavailable or the job is unknown
+    """
+    queue = get_task_queue()
+    if queue is None:
+        return None
+
+    try:
+        return Job.fetch(job_id, connection=queue.connection)
+    except Exception:
+        return None
@@ -0,0 +1,223 @@
+"""
+Helpers for handling file uploads without buffering them in memory.
+"""
+import os
+import json
+import fcntl
+import hashlib
+import tempfile
+import threading
+import logging
+from collections import deque
+from pathlib import Path
+
+from flask import Request
+
+logger = logging.getLogger(__name__)
+
+# Chunk size for copying upload streams that could not be renamed into place
+_CHUNK_SIZE = 1 << 20
+
+class BufferPool:
+    """
+    Bounded pool of reusable fixed-size bytearrays.
+
+    Bursts of batch uploads would otherwise allocate and discard one large
+    copy buffer per file, churning the allocator's large-object arenas;
+    recycling a small set keeps the allocation pattern flat under load.
+    """
+
+    def __init__(self, max_buffers=8, buffer_size=_CHUNK_SIZE):
+        self.buffer_size = buffer_size
+        self._max_buffers = max_buffers
+        self._buffers = deque()
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._buffers:
+                return self._buffers.popleft()
+        return bytearray(self.buffer_size)
+
+    def put(self, buf):
+        with self._lock:
+            if len(self._buffers) < self._max_buffers:
+                self._buffers.append(buf)
+
+_buffer_pool = BufferPool()
+
+class DiskBufferedRequest(Request):
+    """
+    Request subclass that spools every multipart file upload to a named
+    temporary file on disk.
+
+    Werkzeug's default stream factory keeps small uploads in memory and only
+    spills larger ones to a SpooledTemporaryFile; with uploads of up to
+    MAX_CONTENT_LENGTH this can cost hundreds of MB of transient allocations
+    per request. Spooling straight to disk keeps memory use constant and lets
+    the routes publish the finished file with a rename instead of a second
+    copy.
+    """
+
+    # Set by the application once the upload folder is known
+    upload_tmp_dir = None
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        stream = tempfile.NamedTemporaryFile(
+            'wb+', dir=self.upload_tmp_dir, suffix='.part', delete=False
+        )
+        # Werkzeug spools every part during parsing, before any validation
+        # runs; remember the path so close() can reap parts that are never
+        # renamed into place (rejected extensions, errors mid-request)
+        if not hasattr(self, '_spooled_paths'):
+            self._spooled_paths = []
+        self._spooled_paths.append(stream.name)
+        return stream
+
+    def close(self):
+        # save_upload renames accepted uploads away, so any spooled .part
+        # file still on disk when the request ends is an orphan
+        for path in getattr(self, '_spooled_paths', ()):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        super().close()
+
+def save_upload(file, filepath):
+    """
+    Save an uploaded file to its final path.
+
+    If the upload was already spooled to disk (see DiskBufferedRequest) this
+    is a simple rename; otherwise fall back to Werkzeug's chunked save.
+
+    Args:
+        file: Werkzeug FileStorage object for the uploaded file
+        filepath: Destination path for the file
+    """
+    stream_name = getattr(file.stream, 'name', None)
+    if isinstance(stream_name, str) and os.path.exists(stream_name):
+        file.stream.flush()
+        os.replace(stream_name, filepath)
+    elif hasattr(file.stream, 'readinto'):
+        # Copy in fixed-size chunks through a pooled buffer rather than
+        # letting Werkzeug allocate a fresh one per file
+        buf = _buffer_pool.get()
+        view = memoryview(buf)
+        try:
+            with open(filepath, 'wb') as dst:
+                while True:
+                    read = file.stream.readinto(buf)
+                    if not read:
+                        break
+                    dst.write(view[:read])
+        finally:
+            _buffer_pool.put(buf)
+    else:
+        file.save(filepath)
+
+# Name of the on-disk index mapping content digests to processed documents
+_HASH_INDEX_NAME = '.hash_index.json'
+
+# Companion lock file serializing index updates across processes; the index
+# file itself cannot be flocked because os.replace swaps its inode out from
+# under a waiting locker
+_HASH_INDEX_LOCK_NAME = '.hash_index.lock'
+
+_hash_index_lock = threading.Lock()
+
+def file_sha256(filepath):
+    """
+    Return the SHA-256 hex digest of a file's contents
+
+    Args:
+        filepath: Path to the file to hash
+    """
+    with open(filepath, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):
+            # Python 3.11+; uses the SHA-NI accelerated OpenSSL path
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+def processing_cache_key(digest, model_name, use_vision):
+    """
+    Build the content-cache key for a processed document
+
+    The outputs depend on the model and on whether vision analysis ran,
+    not just on the PDF bytes, so those options are part of the key.
+
+    Args:
+        digest: SHA-256 hex digest of the uploaded PDF
+        model_name: Ollama model the document is processed with
+        use_vision: Whether vision analysis is enabled
+
+    Returns:
+        Key string for lookup_processed / record_processed
+    """
+    return f"{digest}:{model_name}:vision={'1' if use_vision else '0'}"
+
+def lookup_processed(processed_dir, digest):
+    """
+    Return the output files already produced for a content digest
+
+    Args:
+        processed_dir: Root folder holding processed documents
+        digest: SHA-256 hex digest of the uploaded PDF
+
+    Returns:
+        Sorted list of output file paths, or None on a cache miss
+    """
+    index_path = Path(processed_dir) / _HASH_INDEX_NAME
+    with _hash_index_lock:
+        try:
+            index = json.loads(index_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    doc_name = index.get(digest)
+    if not doc_name:
+        return None
+
+    doc_dir = Path(processed_dir) / doc_name
+    if not doc_dir.is_dir():
+        return None
+
+    output_files = sorted(str(p) for p in doc_dir.iterdir() if p.is_file())
+    return output_files or None
+
+def record_processed(processed_dir, digest, doc_name):
+    """
+    Record a digest -> document directory mapping in the on-disk index
+
+    Args:
+        processed_dir: Root folder holding processed documents
+        digest: SHA-256 hex digest of the processed PDF
+        doc_name: Name of the document's output subdirectory
+    """
+    index_path = Path(processed_dir) / _HASH_INDEX_NAME
+    with _hash_index_lock:
+        # With a task queue configured the index is also rewritten from RQ
+        # worker processes, which the in-process lock cannot exclude; hold a
+        # file lock across the read-modify-write so concurrent updates (and
+        # their stale-digest evictions) are not lost
+        with open(Path(processed_dir) / _HASH_INDEX_LOCK_NAME, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                index = json.loads(index_path.read_text())
+            except (OSError, ValueError):
+                index = {}
+            # The output directory is keyed by filename, so re-uploading a
+            # same-named PDF with different contents overwrites its outputs;
+            # evict digests still pointing at this directory or they would keep
+            # serving the replaced files as cache hits
+            index = {k: v for k, v in index.items() if v != doc_name}
+            index[digest] = doc_name
+            # Write-then-rename so readers never observe a half-written index
+            tmp_path = index_path.with_name(_HASH_INDEX_NAME + '.tmp')
+            tmp_path.write_text(json.dumps(index, indent=2))
+            os.replace(tmp_path, index_path)
@@ -14,6 +14,11 @@ def main():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
 
+    # Docling and urllib3 log per call; keep them to warnings so large
+    # documents don't pay for (or drown the console in) their chatter
+    logging.getLogger('docling').setLevel(logging.WARNING)
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+
     # Get port from environment or use default
     port = int(os.environ.get('PORT', 5001))
 
@@ -22,7 +27,17 @@ def main():
     print(f"Open your browser at http://localhost:{port}")
     print("Press Ctrl+C to stop the server")
 
-    app.run(host='0.0.0.0', port=port, debug=os.environ.get('DEBUG', 'True').lower() == 'true')
+    # use_reloader=False keeps debug mode from forking a watcher process
+    # that re-imports the app (and reloads the Docling models) on every
+    # source change; threaded=True lets uploads overlap instead of queueing
+    # behind the dev server's single request thread
+    app.run(
+        host='0.0.0.0',
+        port=port,
+        debug=os.environ.get('DEBUG', 'True').lower() == 'true',
+        use_reloader=False,
+        threaded=True,
+    )
 
 if __name__ == '__main__':
     main()